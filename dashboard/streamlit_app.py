@@ -3,12 +3,19 @@
 Streamlit dashboard for viewing clinical risk reports.
 """
 import streamlit as st
+import altair as alt
 import pandas as pd
-import json
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from pathlib import Path
 import sys
-import matplotlib.pyplot as plt
-import seaborn as sns
+import matplotlib
+# Render headless with a pinned font, avoiding GUI backends and font lookups
+matplotlib.use('Agg')
+matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
+from matplotlib.figure import Figure
 import numpy as np
 import os
 
@@ -37,26 +44,129 @@ st.set_page_config(
 DATA_PATH = project_root / 'data' / 'fhir_sample_data.json'
 CSV_REPORT_PATH = project_root / 'outputs' / 'high_risk_report.csv'
 JSON_REPORT_PATH = project_root / 'outputs' / 'high_risk_report.json'
+ALL_SCORED_PATH = project_root / 'outputs' / 'all_scored.parquet'
+
+# Bar colours for the risk categories, in RISK_CATEGORIES order
+RISK_CATEGORY_COLORS = ['green', 'orange', 'red']
+
+# Scatter plots beyond this many points only add overplotting
+MAX_SCATTER_POINTS = 2000
+
+# Columns the dashboard reads from the CSV report, with their parsed types
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+REPORT_COLUMN_TYPES = {
+    'patient_id': pa.string(),
+    'full_name': pa.string(),
+    'age': pa.int16(),
+    'gender': CATEGORY_TYPE,
+    'risk_category': CATEGORY_TYPE,
+    'risk_score': pa.int16(),
+    'hba1c_value': pa.float32(),
+    'cholesterol_value': pa.float32(),
+    'risk_reasons': pa.string()
+}
 
 @st.cache_data
 def load_report_data():
     """Load and return report data."""
     # Check if reports exist, if not generate them
-    if not CSV_REPORT_PATH.exists() or not JSON_REPORT_PATH.exists():
+    if not all(path.exists() for path in (CSV_REPORT_PATH, JSON_REPORT_PATH, ALL_SCORED_PATH)):
         st.info("Generating reports... This may take a moment.")
         # Ensure generate_reports uses the correct file path if needed
         report_info = generate_report.generate_reports(file_path=DATA_PATH)
         st.success("Reports generated!")
     
     # Load CSV report
-    high_risk_df = pd.read_csv(CSV_REPORT_PATH)
+    # Only parse the columns used here, with explicit types (no inference)
+    convert_options = pacsv.ConvertOptions(
+        include_columns=list(REPORT_COLUMN_TYPES),
+        column_types=REPORT_COLUMN_TYPES
+    )
+    high_risk_df = pacsv.read_csv(CSV_REPORT_PATH, convert_options=convert_options).to_pandas()
     
     # Load JSON report for summary
-    with open(JSON_REPORT_PATH, 'r') as f:
-        report_json = json.load(f)
+    report_json = orjson.loads(JSON_REPORT_PATH.read_bytes())
     
     return high_risk_df, report_json
 
+@st.cache_data
+def load_all_scored():
+    """Load and return risk data for all patients, as saved with the reports."""
+    return pd.read_parquet(ALL_SCORED_PATH)
+
+@st.cache_data
+def make_lab_values_figure(hba1c_val, chol_val):
+    """Build the HbA1c and cholesterol bar charts for a single patient."""
+    fig_labs = Figure(figsize=(10, 3))
+    ax1, ax2 = fig_labs.subplots(1, 2)
+    
+    # HbA1c
+    ax1.bar(['HbA1c'], [hba1c_val] if pd.notna(hba1c_val) else [0], color='skyblue')
+    ax1.axhline(y=risk_scoring.DIABETES_HBA1C_THRESHOLD, color='red', linestyle='--')
+    ax1.text(0, risk_scoring.DIABETES_HBA1C_THRESHOLD + 0.1, 'Threshold (6.5)', color='red')
+    ax1.set_ylim(0, max(10, hba1c_val + 1 if pd.notna(hba1c_val) else 10))
+    ax1.set_title('HbA1c Value')
+    
+    # Cholesterol
+    ax2.bar(['Cholesterol'], [chol_val] if pd.notna(chol_val) else [0], color='lightgreen')
+    ax2.axhline(y=risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, color='red', linestyle='--')
+    ax2.text(0, risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD + 5, 'Threshold (240)', color='red')
+    ax2.set_ylim(0, max(250, chol_val + 10 if pd.notna(chol_val) else 250))
+    ax2.set_title('Cholesterol Value')
+    
+    fig_labs.tight_layout()
+    return fig_labs
+
+@st.cache_data
+def make_age_risk_figure(patients_df):
+    """Build the age vs. risk score scatter plot, sampling large populations."""
+    # Fixed seed keeps the sample stable across reruns
+    if len(patients_df) > MAX_SCATTER_POINTS:
+        patients_df = patients_df.sample(n=MAX_SCATTER_POINTS, random_state=0)
+    age = patients_df['age']
+    risk_score = patients_df['risk_score']
+    
+    fig_scatter = Figure(figsize=(10, 6))
+    ax_scatter = fig_scatter.subplots()
+    scatter = ax_scatter.scatter(
+        age,
+        risk_score,
+        c=risk_score,
+        cmap='YlOrRd',
+        alpha=0.7,
+        s=100
+    )
+    
+    fig_scatter.colorbar(scatter, ax=ax_scatter, label='Risk Score')
+    ax_scatter.set_title('Age vs. Risk Score')
+    ax_scatter.set_xlabel('Age')
+    ax_scatter.set_ylabel('Risk Score')
+    ax_scatter.grid(True, alpha=0.3)
+    
+    return fig_scatter
+
+def _draw_distribution(ax_dist, values, threshold, label_offset, lab_name):
+    """Draw a histogram of lab values with the risk threshold marked."""
+    # Pre-bin with NumPy and draw the bars directly (no KDE pass)
+    counts, edges = np.histogram(values, bins=15)
+    ax_dist.bar(edges[:-1], counts, width=np.diff(edges), align='edge', edgecolor='white')
+    ax_dist.axvline(x=threshold, color='red', linestyle='--')
+    ax_dist.text(threshold + label_offset, ax_dist.get_ylim()[1] * 0.9, f'Threshold ({threshold:g})', color='red')
+    ax_dist.set_title(f'{lab_name} Distribution')
+    ax_dist.set_xlabel(f'{lab_name} Value')
+    ax_dist.set_ylabel('Count')
+
+@st.cache_data
+def make_distributions_figure(hba1c_values, cholesterol_values):
+    """Build the HbA1c and cholesterol histograms side by side in one Figure."""
+    fig_dist = Figure(figsize=(16, 6))
+    ax_hba1c, ax_chol = fig_dist.subplots(1, 2)
+    _draw_distribution(ax_hba1c, hba1c_values, risk_scoring.DIABETES_HBA1C_THRESHOLD, 0.1, 'HbA1c')
+    _draw_distribution(ax_chol, cholesterol_values, risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, 5, 'Cholesterol')
+    fig_dist.tight_layout()
+    
+    return fig_dist
+
 def main():
     """Main Streamlit application."""
     # Header
@@ -78,11 +188,11 @@ def main():
     max_age = int(high_risk_df['age'].max())
     age_range = st.sidebar.slider("Age Range", min_age, max_age, (min_age, max_age))
     
-    # Apply filters
-    filtered_df = high_risk_df.copy()
+    # Apply filters as one combined mask, selecting rows only once
+    mask = high_risk_df['age'].between(age_range[0], age_range[1])
     if selected_risk != 'All':
-        filtered_df = filtered_df[filtered_df['risk_category'] == selected_risk]
-    filtered_df = filtered_df[(filtered_df['age'] >= age_range[0]) & (filtered_df['age'] <= age_range[1])]
+        mask &= high_risk_df['risk_category'] == selected_risk
+    filtered_df = high_risk_df.loc[mask]
     
     # Main dashboard
     col1, col2 = st.columns([1, 2])
@@ -106,31 +216,27 @@ def main():
         
         # Risk categories
         st.subheader("Risk Categories")
-        risk_data = pd.DataFrame({
-            'Category': list(summary['risk_category_counts'].keys()),
-            'Count': list(summary['risk_category_counts'].values())
-        })
-        
-        # Create horizontal bar chart
-        fig, ax = plt.subplots(figsize=(5, 3))
-        colors = ['green', 'orange', 'red'] # Assuming Low, Moderate, High order
-        # Ensure correct order for colors if needed
-        ordered_categories = ['Low Risk', 'Moderate Risk', 'High Risk'] 
-        risk_data = risk_data.set_index('Category').reindex(ordered_categories).reset_index()
-        risk_data = risk_data.dropna() # Remove categories not present
-        
-        bars = ax.barh(risk_data['Category'], risk_data['Count'], color=colors[:len(risk_data)])
-        ax.set_title('Patient Risk Categories')
-        ax.set_xlabel('Number of Patients')
-        
-        # Add counts as labels
-        for i, bar in enumerate(bars):
-            width = bar.get_width()
-            label_x_pos = width + 0.5
-            ax.text(label_x_pos, bar.get_y() + bar.get_height()/2, f'{int(width)}', 
-                    va='center')
+        categories = risk_scoring.RISK_CATEGORIES
+        # Reports written before risk_category_ordered existed only have the counts
+        if 'risk_category_ordered' in summary:
+            risk_data = pd.DataFrame(summary['risk_category_ordered'])
+        else:
+            category_counts = summary['risk_category_counts']
+            risk_data = pd.DataFrame({
+                'Category': categories,
+                'Count': [category_counts.get(category, 0) for category in categories]
+            })
         
-        st.pyplot(fig)
+        # Native horizontal bar chart; the explicit sort and colour scale keep
+        # the bars in severity order (Low, Moderate, High) instead of alphabetical
+        bars = alt.Chart(risk_data).mark_bar().encode(
+            x=alt.X('Count:Q', title='Number of Patients'),
+            y=alt.Y('Category:N', sort=categories, title=None),
+            color=alt.Color('Category:N', sort=categories, legend=None,
+                            scale=alt.Scale(domain=categories, range=RISK_CATEGORY_COLORS))
+        )
+        labels = bars.mark_text(align='left', dx=3).encode(text='Count:Q')
+        st.altair_chart((bars + labels).properties(title='Patient Risk Categories'))
     
     # Patient data table
     with col2:
@@ -153,11 +259,12 @@ def main():
             # Display the table
             st.dataframe(display_df, height=400)
             
-            # Select a patient for detailed view
+            # Select a patient for detailed view; labels are built once, not per option
+            display_labels = (filtered_df['full_name'] + ' (ID: ' + filtered_df['patient_id'].astype(str) + ')').tolist()
             selected_patient_idx = st.selectbox(
                 "Select a patient for detailed view:",
                 options=range(len(filtered_df)),
-                format_func=lambda i: f"{filtered_df.iloc[i]['full_name']} (ID: {filtered_df.iloc[i]['patient_id']})"
+                format_func=display_labels.__getitem__
             )
             
             if selected_patient_idx is not None:
@@ -185,25 +292,7 @@ def main():
                     st.markdown("**Lab Values**")
                     
                     # Create a mini chart for lab values
-                    fig_labs, (ax1, ax2) = plt.subplots(1, 2, figsize=(10, 3))
-                    
-                    # HbA1c
-                    hba1c_val = patient['hba1c_value']
-                    ax1.bar(['HbA1c'], [hba1c_val] if pd.notna(hba1c_val) else [0], color='skyblue')
-                    ax1.axhline(y=risk_scoring.DIABETES_HBA1C_THRESHOLD, color='red', linestyle='--')
-                    ax1.text(0, risk_scoring.DIABETES_HBA1C_THRESHOLD + 0.1, 'Threshold (6.5)', color='red')
-                    ax1.set_ylim(0, max(10, hba1c_val + 1 if pd.notna(hba1c_val) else 10))
-                    ax1.set_title('HbA1c Value')
-                    
-                    # Cholesterol
-                    chol_val = patient['cholesterol_value']
-                    ax2.bar(['Cholesterol'], [chol_val] if pd.notna(chol_val) else [0], color='lightgreen')
-                    ax2.axhline(y=risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, color='red', linestyle='--')
-                    ax2.text(0, risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD + 5, 'Threshold (240)', color='red')
-                    ax2.set_ylim(0, max(250, chol_val + 10 if pd.notna(chol_val) else 250))
-                    ax2.set_title('Cholesterol Value')
-                    
-                    plt.tight_layout()
+                    fig_labs = make_lab_values_figure(patient['hba1c_value'], patient['cholesterol_value'])
                     st.pyplot(fig_labs)
         else:
             st.info("No patients match the selected filters.")
@@ -213,56 +302,24 @@ def main():
     st.subheader("Risk Visualizations")
     
     # Get all patients with risk data for visualizations
-    patients_with_risks_df, _ = risk_scoring.score_patient_risks(file_path=DATA_PATH)
+    patients_with_risks_df = load_all_scored()
     
     # Create tabs for different visualizations
     tab1, tab2, tab3 = st.tabs(["Age vs. Risk", "Lab Values Distribution", "Medication Analysis"])
     
     with tab1:
         # Age vs. Risk Score scatter plot
-        fig_scatter, ax_scatter = plt.subplots(figsize=(10, 6))
-        scatter = ax_scatter.scatter(
-            patients_with_risks_df['age'],
-            patients_with_risks_df['risk_score'],
-            c=patients_with_risks_df['risk_score'],
-            cmap='YlOrRd',
-            alpha=0.7,
-            s=100
-        )
-        
-        plt.colorbar(scatter, label='Risk Score')
-        ax_scatter.set_title('Age vs. Risk Score')
-        ax_scatter.set_xlabel('Age')
-        ax_scatter.set_ylabel('Risk Score')
-        ax_scatter.grid(True, alpha=0.3)
+        fig_scatter = make_age_risk_figure(patients_with_risks_df[['age', 'risk_score']])
         
         st.pyplot(fig_scatter)
     
     with tab2:
-        # Create columns for HbA1c and Cholesterol distributions
-        dist_col1, dist_col2 = st.columns(2)
-        
-        with dist_col1:
-            # HbA1c distribution
-            fig_hba1c, ax_hba1c = plt.subplots(figsize=(8, 6))
-            sns.histplot(patients_with_risks_df['hba1c_value'].dropna(), bins=15, kde=True, ax=ax_hba1c)
-            ax_hba1c.axvline(x=risk_scoring.DIABETES_HBA1C_THRESHOLD, color='red', linestyle='--')
-            ax_hba1c.text(risk_scoring.DIABETES_HBA1C_THRESHOLD + 0.1, ax_hba1c.get_ylim()[1] * 0.9, 'Threshold (6.5)', color='red')
-            ax_hba1c.set_title('HbA1c Distribution')
-            ax_hba1c.set_xlabel('HbA1c Value')
-            ax_hba1c.set_ylabel('Count')
-            st.pyplot(fig_hba1c)
-        
-        with dist_col2:
-            # Cholesterol distribution
-            fig_chol, ax_chol = plt.subplots(figsize=(8, 6))
-            sns.histplot(patients_with_risks_df['cholesterol_value'].dropna(), bins=15, kde=True, ax=ax_chol)
-            ax_chol.axvline(x=risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, color='red', linestyle='--')
-            ax_chol.text(risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD + 5, ax_chol.get_ylim()[1] * 0.9, 'Threshold (240)', color='red')
-            ax_chol.set_title('Cholesterol Distribution')
-            ax_chol.set_xlabel('Cholesterol Value')
-            ax_chol.set_ylabel('Count')
-            st.pyplot(fig_chol)
+        # HbA1c and Cholesterol distributions share one Figure
+        fig_dist = make_distributions_figure(
+            patients_with_risks_df['hba1c_value'].dropna(),
+            patients_with_risks_df['cholesterol_value'].dropna()
+        )
+        st.pyplot(fig_dist)
     
     with tab3:
         st.write("This tab will contain medication adherence analysis in a future update.")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Convert FHIR JSON data into a Parquet cache for faster loading.
+"""
+# Import from our local module
+import scripts.load_data as load_data
+
+def build_cache(file_path=None):
+    """
+    Normalize FHIR data once and write each table to Parquet.
+    
+    load_data.load_and_normalize_data reads these files instead of the
+    JSON bundle for as long as they are newer than it.
+    
+    Args:
+        file_path (str, optional): Path to the FHIR JSON file.
+            If None, use default path. The cache is written to a
+            'cache' directory next to the JSON file.
+            
+    Returns:
+        dict: Mapping of table name to the written Parquet file path
+    """
+    if file_path is None:
+        file_path = load_data.DEFAULT_DATA_PATH
+    
+    # Always normalize from the JSON source, never from a stale cache
+    data = load_data.load_fhir_data(file_path)
+    tables = {
+        'patients': load_data.normalize_patients(data),
+        'observations': load_data.normalize_observations(data),
+        'medications': load_data.normalize_medications(data),
+        'allergies': load_data.normalize_allergies(data)
+    }
+    
+    cache_paths = load_data.get_cache_paths(file_path)
+    for table, df in tables.items():
+        path = cache_paths[table]
+        path.parent.mkdir(exist_ok=True, parents=True)
+        df.to_parquet(path, compression='zstd', index=False)
+    
+    return {table: str(path) for table, path in cache_paths.items()}
+
+if __name__ == "__main__":
+    # Build the cache for the default data file
+    cache_paths = build_cache()
+    
+    for table, path in cache_paths.items():
+        print(f"Cached {table}: {path}")
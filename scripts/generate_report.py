@@ -2,10 +2,17 @@
 """
 Generate reports of high-risk patients and insights.
 """
+import hashlib
 import pandas as pd
-import json
-import numpy as np
+import orjson
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import matplotlib
+# Render headless with a pinned font, avoiding GUI backends and font lookups
+matplotlib.use('Agg')
+matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
 import matplotlib.pyplot as plt
 import seaborn as sns
 
@@ -14,18 +21,9 @@ import scripts.load_data as load_data
 import scripts.process_patients as process_patients
 import scripts.risk_scoring as risk_scoring
 
-# Custom JSON encoder to handle NumPy data types
-class NpEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        if isinstance(obj, np.floating):
-            return float(obj)
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        if isinstance(obj, np.bool_):
-            return bool(obj)
-        return super(NpEncoder, self).default(obj)
+# Part of every visualization digest; bump it when the chart style changes
+# (rcParams, sns.set) so existing PNGs are re-rendered
+VISUALIZATION_VERSION = 1
 
 def filter_high_risk_patients(patients_with_risks_df):
     """
@@ -37,13 +35,11 @@ def filter_high_risk_patients(patients_with_risks_df):
     Returns:
         pandas.DataFrame: DataFrame with only high-risk patients
     """
-    # Filter for patients with at least one risk factor
-    high_risk_df = patients_with_risks_df[patients_with_risks_df['risk_score'] > 0].copy()
+    # Filter for patients with at least one risk factor (boolean selection copies)
+    high_risk_df = patients_with_risks_df[patients_with_risks_df['risk_score'] > 0]
     
-    # Sort by risk score (descending)
-    high_risk_df = high_risk_df.sort_values('risk_score', ascending=False)
-    
-    return high_risk_df
+    # Sort by risk score (descending); stable sort keeps ties in input order
+    return high_risk_df.sort_values('risk_score', ascending=False, kind='stable')
 
 def generate_csv_report(high_risk_df, output_path):
     """
@@ -65,8 +61,8 @@ def generate_csv_report(high_risk_df, output_path):
     # Create the report DataFrame
     report_df = high_risk_df[report_columns].copy()
     
-    # Save to CSV
-    report_df.to_csv(output_path, index=False)
+    # Save to CSV with Arrow's native writer
+    pacsv.write_csv(pa.Table.from_pandas(report_df, preserve_index=False), str(output_path))
     
     return output_path
 
@@ -82,40 +78,79 @@ def generate_json_report(high_risk_df, risk_summary, output_path):
     Returns:
         str: Path to the generated JSON file
     """
+    # Cast cells to native Python values up front; missing values (NaN, NaT,
+    # pd.NA) become None so they serialize as null
+    records = (high_risk_df
+               .astype(object)
+               .where(high_risk_df.notna(), None)
+               .to_dict(orient='records'))
+    
+    # Add category counts in display order, ready for charting
+    category_counts = risk_summary['risk_category_counts']
+    summary = {
+        **risk_summary,
+        'risk_category_ordered': [
+            {'Category': category, 'Count': int(category_counts.get(category, 0))}
+            for category in risk_scoring.RISK_CATEGORIES
+        ]
+    }
+    
     # Create report structure
     report = {
         'report_date': pd.Timestamp.now().strftime('%Y-%m-%d'),
-        'summary': risk_summary,
-        'high_risk_patients': high_risk_df.to_dict(orient='records')
+        'summary': summary,
+        'high_risk_patients': records
     }
     
-    # Save to JSON using the custom encoder
-    with open(output_path, 'w') as f:
-        json.dump(report, f, indent=2, cls=NpEncoder)
+    # Save to JSON; orjson serializes NumPy scalars and arrays natively
+    with open(output_path, 'wb') as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     return output_path
 
-def generate_visualizations(patients_with_risks_df, output_dir):
+def _render_if_changed(path, data, plot_func, *args):
     """
-    Generate visualizations of patient risk data.
+    Render a visualization unless the file already holds a plot of the same data.
+    
+    The digest covers the plotted data and arguments, the plot function's
+    code, VISUALIZATION_VERSION and the matplotlib/seaborn versions. It is
+    stored in a '<name>.sha1' file next to the image, so the check also
+    holds across runs.
     
     Args:
-        patients_with_risks_df (pandas.DataFrame): DataFrame with patient risk data
-        output_dir (str): Directory to save the visualizations
+        path (pathlib.Path): Path to save the visualization
+        data (pandas.DataFrame or pandas.Series): Data to plot
+        plot_func (callable): Called as plot_func(data, *args, path) to render
+        *args: Extra arguments passed through to plot_func
         
     Returns:
-        list: Paths to the generated visualization files
+        str: Path to the visualization file
     """
-    output_paths = []
-    output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True, parents=True)
+    sha1 = hashlib.sha1(pd.util.hash_pandas_object(data).to_numpy().tobytes())
+    sha1.update(repr(args).encode())
+    # Changes to the plotting code or the libraries must invalidate the image too
+    code = plot_func.__code__
+    sha1.update(code.co_code + repr(code.co_consts).encode())
+    sha1.update(f'{VISUALIZATION_VERSION}:{matplotlib.__version__}:{sns.__version__}'.encode())
+    digest = sha1.hexdigest()
     
-    # Set style
-    sns.set(style="whitegrid")
+    digest_path = path.with_name(path.name + '.sha1')
+    if path.exists() and digest_path.exists() and digest_path.read_text() == digest:
+        return str(path)
     
-    # 1. Risk Category Distribution
+    plot_func(data, *args, path)
+    digest_path.write_text(digest)
+    return str(path)
+
+def _plot_risk_distribution(risk_counts, path):
+    """
+    Plot the number of patients per risk category.
+    
+    Args:
+        risk_counts (pandas.Series): Patient counts indexed by risk category
+        path (pathlib.Path): Path to save the visualization
+    """
     plt.figure(figsize=(10, 6))
-    risk_counts = patients_with_risks_df['risk_category'].value_counts()
     ax = sns.barplot(x=risk_counts.index, y=risk_counts.values)
     plt.title('Distribution of Risk Categories')
     plt.xlabel('Risk Category')
@@ -123,55 +158,83 @@ def generate_visualizations(patients_with_risks_df, output_dir):
     for i, v in enumerate(risk_counts.values):
         ax.text(i, v + 0.5, str(v), ha='center')
     
-    risk_dist_path = output_dir / 'risk_category_distribution.png'
     plt.tight_layout()
-    plt.savefig(risk_dist_path)
+    plt.savefig(path)
     plt.close()
-    output_paths.append(str(risk_dist_path))
+
+def _plot_age_vs_lab(lab_df, lab_column, threshold, lab_name, path):
+    """
+    Plot age against a lab value, colored by risk score.
     
-    # 2. Age vs. HbA1c with risk highlighting
+    Args:
+        lab_df (pandas.DataFrame): DataFrame with age, risk_score and the lab column
+        lab_column (str): Name of the lab value column
+        threshold (float): Risk threshold to mark on the plot
+        lab_name (str): Display name of the lab value
+        path (pathlib.Path): Path to save the visualization
+    """
     plt.figure(figsize=(10, 6))
     scatter = plt.scatter(
-        patients_with_risks_df['age'], 
-        patients_with_risks_df['hba1c_value'],
-        c=patients_with_risks_df['risk_score'],
+        lab_df['age'], 
+        lab_df[lab_column],
+        c=lab_df['risk_score'],
         cmap='YlOrRd',
         alpha=0.7
     )
     plt.colorbar(scatter, label='Risk Score')
-    plt.axhline(y=risk_scoring.DIABETES_HBA1C_THRESHOLD, color='red', linestyle='--', alpha=0.7)
-    plt.title('Age vs. HbA1c with Risk Highlighting')
+    plt.axhline(y=threshold, color='red', linestyle='--', alpha=0.7)
+    plt.title(f'Age vs. {lab_name} with Risk Highlighting')
     plt.xlabel('Age')
-    plt.ylabel('HbA1c Value')
+    plt.ylabel(f'{lab_name} Value')
     plt.grid(True, alpha=0.3)
     
-    age_hba1c_path = output_dir / 'age_vs_hba1c.png'
     plt.tight_layout()
-    plt.savefig(age_hba1c_path)
+    plt.savefig(path)
     plt.close()
-    output_paths.append(str(age_hba1c_path))
+
+def generate_visualizations(patients_with_risks_df, output_dir):
+    """
+    Generate visualizations of patient risk data.
     
-    # 3. Age vs. Cholesterol with risk highlighting
-    plt.figure(figsize=(10, 6))
-    scatter = plt.scatter(
-        patients_with_risks_df['age'], 
-        patients_with_risks_df['cholesterol_value'],
-        c=patients_with_risks_df['risk_score'],
-        cmap='YlOrRd',
-        alpha=0.7
-    )
-    plt.colorbar(scatter, label='Risk Score')
-    plt.axhline(y=risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, color='red', linestyle='--', alpha=0.7)
-    plt.title('Age vs. Cholesterol with Risk Highlighting')
-    plt.xlabel('Age')
-    plt.ylabel('Cholesterol Value')
-    plt.grid(True, alpha=0.3)
+    A visualization is only re-rendered when its input data changed since
+    it was last written, or when the file is missing.
     
-    age_chol_path = output_dir / 'age_vs_cholesterol.png'
-    plt.tight_layout()
-    plt.savefig(age_chol_path)
-    plt.close()
-    output_paths.append(str(age_chol_path))
+    Args:
+        patients_with_risks_df (pandas.DataFrame): DataFrame with patient risk data
+        output_dir (str): Directory to save the visualizations
+        
+    Returns:
+        list: Paths to the generated visualization files
+    """
+    output_paths = []
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True, parents=True)
+    
+    # Set style
+    sns.set(style="whitegrid", font='DejaVu Sans')
+    
+    # 1. Risk Category Distribution
+    # Counts in severity order, so bar order and label order are the same list
+    risk_counts = (patients_with_risks_df['risk_category']
+                   .value_counts()
+                   .reindex(risk_scoring.RISK_CATEGORIES, fill_value=0))
+    output_paths.append(_render_if_changed(
+        output_dir / 'risk_category_distribution.png', risk_counts, _plot_risk_distribution
+    ))
+    
+    # 2. Age vs. HbA1c with risk highlighting
+    output_paths.append(_render_if_changed(
+        output_dir / 'age_vs_hba1c.png',
+        patients_with_risks_df[['age', 'hba1c_value', 'risk_score']],
+        _plot_age_vs_lab, 'hba1c_value', risk_scoring.DIABETES_HBA1C_THRESHOLD, 'HbA1c'
+    ))
+    
+    # 3. Age vs. Cholesterol with risk highlighting
+    output_paths.append(_render_if_changed(
+        output_dir / 'age_vs_cholesterol.png',
+        patients_with_risks_df[['age', 'cholesterol_value', 'risk_score']],
+        _plot_age_vs_lab, 'cholesterol_value', risk_scoring.CARDIOVASCULAR_CHOLESTEROL_THRESHOLD, 'Cholesterol'
+    ))
     
     return output_paths
 
@@ -210,6 +273,10 @@ def generate_reports(file_path=None, output_dir=None):
     json_path = output_dir / 'high_risk_report.json'
     json_report_path = generate_json_report(high_risk_df, risk_summary, json_path)
     
+    # Save all scored patients so the dashboard can skip re-scoring
+    all_scored_path = output_dir / 'all_scored.parquet'
+    patients_with_risks_df.to_parquet(all_scored_path, index=False)
+    
     # Generate visualizations
     viz_dir = output_dir / 'visualizations'
     viz_paths = generate_visualizations(patients_with_risks_df, viz_dir)
@@ -218,6 +285,7 @@ def generate_reports(file_path=None, output_dir=None):
     report_info = {
         'csv_report_path': str(csv_report_path),
         'json_report_path': str(json_report_path),
+        'all_scored_path': str(all_scored_path),
         'visualization_paths': viz_paths,
         'high_risk_count': len(high_risk_df),
         'total_patients': risk_summary['total_patients'],
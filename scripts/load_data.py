@@ -2,10 +2,24 @@
 """
 Load FHIR data from JSON file and normalize into pandas DataFrames.
 """
-import json
+import functools
+import numpy as np
+import orjson
 import pandas as pd
 from pathlib import Path
 
+# Default FHIR bundle, relative to project root
+DEFAULT_DATA_PATH = Path(__file__).parent.parent / 'data' / 'fhir_sample_data.json'
+
+# Resource tables written to / read from the Parquet cache
+CACHE_TABLES = ('patients', 'observations', 'medications', 'allergies')
+
+# Bundles larger than this are streamed one resource array at a time
+STREAMING_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+# Arrow-backed strings: contiguous UTF-8 buffers instead of Python objects
+STRING_DTYPE = 'string[pyarrow]'
+
 def load_fhir_data(file_path):
     """
     Load FHIR data from JSON file.
@@ -16,10 +30,47 @@ def load_fhir_data(file_path):
     Returns:
         dict: The FHIR data as a dictionary
     """
-    with open(file_path, 'r') as f:
-        data = json.load(f)
+    # orjson parses straight from bytes, skipping the text decode step
+    data = orjson.loads(Path(file_path).read_bytes())
     return data
 
+def load_fhir_resources(file_path, resource_key):
+    """
+    Stream a single top-level resource array out of a FHIR JSON file.
+    
+    Only the requested array is materialized, which bounds peak memory
+    for bundles too large to parse in one go. Each call re-reads and parses
+    the whole file, so loading all four resource arrays parses it four
+    times. Requires ijson; raises ImportError if it is not installed.
+    
+    Args:
+        file_path (str): Path to the FHIR JSON file
+        resource_key (str): Top-level key of the array, e.g. 'observations'
+        
+    Returns:
+        dict: FHIR data containing only the requested resources
+    """
+    # Only needed for very large bundles, so imported on demand
+    import ijson
+    
+    with open(file_path, 'rb') as f:
+        resources = list(ijson.items(f, f'{resource_key}.item', use_float=True))
+    return {resource_key: resources}
+
+def _reference_ids(references):
+    """
+    Extract resource ids from FHIR references (format: "Patient/patient-X").
+    
+    Args:
+        references (pandas.Series): Reference strings, possibly missing
+        
+    Returns:
+        pandas.Series: Id after the last '/', or '' for missing references
+    """
+    # Arrow-backed strings run the regex in a single compiled kernel
+    references = references.fillna('').astype(STRING_DTYPE)
+    return references.str.replace(r'^.*/', '', regex=True)
+
 def normalize_patients(data):
     """
     Convert FHIR patients into pandas DataFrame.
@@ -30,44 +81,32 @@ def normalize_patients(data):
     Returns:
         pandas.DataFrame: Normalized patient data
     """
-    patients = []
+    patients = data.get('patients', [])
     
-    for patient in data.get('patients', []):
-        # Extract basic information
-        patient_id = patient.get('id', '')
-        
-        # Extract name
-        name = patient.get('name', [{}])[0]
-        family_name = name.get('family', '')
-        given_names = name.get('given', [''])
-        full_name = f"{' '.join(given_names)} {family_name}"
-        
-        # Extract gender and birthdate
-        gender = patient.get('gender', '')
-        birthdate = patient.get('birthDate', '')
-        
-        # Extract address
-        address = patient.get('address', [{}])[0]
-        city = address.get('city', '')
-        state = address.get('state', '')
-        postal_code = address.get('postalCode', '')
-        
-        # Create a dictionary for this patient
-        patient_dict = {
-            'patient_id': patient_id,
-            'full_name': full_name,
-            'family_name': family_name,
-            'given_name': given_names[0] if given_names else '',
-            'gender': gender,
-            'birthdate': birthdate,
-            'city': city,
-            'state': state,
-            'postal_code': postal_code
-        }
-        
-        patients.append(patient_dict)
+    # One comprehension per field; packing a tuple per record and transposing
+    # with zip allocates enough objects to keep the garbage collector busy
+    patient_ids = [patient.get('id', '') for patient in patients]
+    names = [(patient.get('name') or [{}])[0] for patient in patients]
+    genders = [patient.get('gender', '') for patient in patients]
+    birthdates = [patient.get('birthDate', '') for patient in patients]
+    addresses = [(patient.get('address') or [{}])[0] for patient in patients]
     
-    return pd.DataFrame(patients)
+    family_names = [name.get('family', '') for name in names]
+    given_names = [name.get('given') or [''] for name in names]
+    
+    patients_df = pd.DataFrame({
+        'patient_id': patient_ids,
+        'full_name': [f"{' '.join(given)} {family}" for given, family in zip(given_names, family_names)],
+        'family_name': family_names,
+        'given_name': [given[0] for given in given_names],
+        'gender': genders,
+        'birthdate': birthdates,
+        'city': [address.get('city', '') for address in addresses],
+        'state': [address.get('state', '') for address in addresses],
+        'postal_code': [address.get('postalCode', '') for address in addresses]
+    })
+    
+    return patients_df.astype(STRING_DTYPE)
 
 def normalize_observations(data):
     """
@@ -79,40 +118,28 @@ def normalize_observations(data):
     Returns:
         pandas.DataFrame: Normalized observation data
     """
-    observations = []
+    observations = data.get('observations', [])
     
-    for obs in data.get('observations', []):
-        # Extract basic information
-        obs_id = obs.get('id', '')
-        status = obs.get('status', '')
-        code_text = obs.get('code', {}).get('text', '')
-        
-        # Extract value
-        value_quantity = obs.get('valueQuantity', {})
-        value = value_quantity.get('value', None)
-        unit = value_quantity.get('unit', '')
-        
-        # Extract date and patient reference
-        date = obs.get('effectiveDateTime', '')
-        patient_ref = obs.get('subject', {}).get('reference', '')
-        
-        # Extract patient_id from reference (format: "Patient/patient-X")
-        patient_id = patient_ref.split('/')[-1] if patient_ref else ''
-        
-        # Create a dictionary for this observation
-        obs_dict = {
-            'observation_id': obs_id,
-            'status': status,
-            'code': code_text,
-            'value': value,
-            'unit': unit,
-            'date': date,
-            'patient_id': patient_id
-        }
-        
-        observations.append(obs_dict)
+    # One comprehension per field, reusing the valueQuantity dicts for value and unit
+    quantities = [obs.get('valueQuantity', {}) for obs in observations]
+    references = [obs.get('subject', {}).get('reference', '') for obs in observations]
+    
+    obs_df = pd.DataFrame({
+        'observation_id': [obs.get('id', '') for obs in observations],
+        'status': [obs.get('status', '') for obs in observations],
+        'code': [obs.get('code', {}).get('text', '') for obs in observations],
+        # A typed float array; missing values become NaN
+        'value': np.array([q.get('value') for q in quantities], dtype='float64'),
+        'unit': [q.get('unit', '') for q in quantities],
+        'date': [obs.get('effectiveDateTime', '') for obs in observations],
+        'patient_id': _reference_ids(pd.Series(references, dtype=object))
+    })
     
-    return pd.DataFrame(observations)
+    # Few distinct codes, units and statuses repeat across many rows
+    return obs_df.astype({
+        'observation_id': STRING_DTYPE, 'date': STRING_DTYPE,
+        'code': 'category', 'unit': 'category', 'status': 'category'
+    })
 
 def normalize_medications(data):
     """
@@ -124,35 +151,33 @@ def normalize_medications(data):
     Returns:
         pandas.DataFrame: Normalized medication data
     """
-    medications = []
+    medications = data.get('medications', [])
     
-    for med in data.get('medications', []):
-        # Extract basic information
-        med_id = med.get('id', '')
-        status = med.get('status', '')
-        
-        # Extract medication name
-        med_name = med.get('medicationCodeableConcept', {}).get('text', '')
-        
-        # Extract patient reference and date
-        patient_ref = med.get('subject', {}).get('reference', '')
-        date = med.get('authoredOn', '')
-        
-        # Extract patient_id from reference (format: "Patient/patient-X")
-        patient_id = patient_ref.split('/')[-1] if patient_ref else ''
-        
-        # Create a dictionary for this medication
-        med_dict = {
-            'medication_id': med_id,
-            'status': status,
-            'medication_name': med_name,
-            'date': date,
-            'patient_id': patient_id
-        }
-        
-        medications.append(med_dict)
+    # One comprehension per field
+    references = [med.get('subject', {}).get('reference', '') for med in medications]
+    
+    return pd.DataFrame({
+        'medication_id': [med.get('id', '') for med in medications],
+        'status': [med.get('status', '') for med in medications],
+        'medication_name': [med.get('medicationCodeableConcept', {}).get('text', '') for med in medications],
+        'date': [med.get('authoredOn', '') for med in medications],
+        'patient_id': _reference_ids(pd.Series(references, dtype=object))
+    })
+
+def _first_manifestation(allergy):
+    """
+    Get the first manifestation text of an allergy's first reaction.
     
-    return pd.DataFrame(medications)
+    Args:
+        allergy (dict): FHIR allergy intolerance resource
+        
+    Returns:
+        str: Manifestation text, or '' if there is none
+    """
+    reactions = allergy.get('reaction', [{}])
+    if not reactions:
+        return ''
+    return reactions[0].get('manifestation', [{}])[0].get('text', '')
 
 def normalize_allergies(data):
     """
@@ -164,43 +189,61 @@ def normalize_allergies(data):
     Returns:
         pandas.DataFrame: Normalized allergy data
     """
-    allergies = []
+    allergies = data.get('allergies', [])
     
-    for allergy in data.get('allergies', []):
-        # Extract basic information
-        allergy_id = allergy.get('id', '')
-        status = allergy.get('clinicalStatus', {}).get('text', '')
-        
-        # Extract allergy code/name
-        code_text = allergy.get('code', {}).get('text', '')
-        
-        # Extract reaction
-        reactions = allergy.get('reaction', [{}])
-        manifestation = reactions[0].get('manifestation', [{}])[0].get('text', '') if reactions else ''
-        
-        # Extract patient reference
-        patient_ref = allergy.get('patient', {}).get('reference', '')
-        
-        # Extract patient_id from reference (format: "Patient/patient-X")
-        patient_id = patient_ref.split('/')[-1] if patient_ref else ''
-        
-        # Create a dictionary for this allergy
-        allergy_dict = {
-            'allergy_id': allergy_id,
-            'status': status,
-            'allergy_type': code_text,
-            'manifestation': manifestation,
-            'patient_id': patient_id
-        }
-        
-        allergies.append(allergy_dict)
+    # One comprehension per field
+    references = [allergy.get('patient', {}).get('reference', '') for allergy in allergies]
     
-    return pd.DataFrame(allergies)
+    return pd.DataFrame({
+        'allergy_id': [allergy.get('id', '') for allergy in allergies],
+        'status': [allergy.get('clinicalStatus', {}).get('text', '') for allergy in allergies],
+        'allergy_type': [allergy.get('code', {}).get('text', '') for allergy in allergies],
+        'manifestation': [_first_manifestation(allergy) for allergy in allergies],
+        'patient_id': _reference_ids(pd.Series(references, dtype=object))
+    })
+
+def get_cache_paths(file_path):
+    """
+    Get the Parquet cache file paths for a FHIR JSON file.
+    
+    The cache lives in a 'cache' directory next to the JSON file.
+    
+    Args:
+        file_path (str): Path to the FHIR JSON file
+    
+    Returns:
+        dict: Mapping of table name to Parquet file path
+    """
+    file_path = Path(file_path)
+    cache_dir = file_path.parent / 'cache' / file_path.stem
+    return {table: cache_dir / f'{table}.parquet' for table in CACHE_TABLES}
+
+def is_cache_fresh(file_path, cache_paths):
+    """
+    Check whether every Parquet cache file exists and is newer than the JSON.
+    
+    Args:
+        file_path (str): Path to the FHIR JSON file
+        cache_paths (dict): Mapping of table name to Parquet file path
+    
+    Returns:
+        bool: True if the cache can be used instead of the JSON file
+    """
+    json_mtime = Path(file_path).stat().st_mtime
+    return all(path.exists() and path.stat().st_mtime > json_mtime
+               for path in cache_paths.values())
 
 def load_and_normalize_data(file_path=None):
     """
     Main function to load FHIR data and convert to DataFrames.
     
+    If a Parquet cache built by scripts/build_cache.py is newer than the
+    JSON file, the DataFrames are read from the cache instead.
+    
+    Results are cached per file path and modification time, so repeated
+    calls for an unchanged file return the same DataFrames without
+    re-parsing. Callers must treat the returned DataFrames as read-only.
+    
     Args:
         file_path (str, optional): Path to the FHIR JSON file.
             If None, use default path.
@@ -209,8 +252,43 @@ def load_and_normalize_data(file_path=None):
         tuple: (patients_df, observations_df, medications_df, allergies_df)
     """
     if file_path is None:
-        # Default path relative to project root
-        file_path = Path(__file__).parent.parent / 'data' / 'fhir_sample_data.json'
+        file_path = DEFAULT_DATA_PATH
+    
+    # Key the cache on the resolved path, so str, Path and relative spellings
+    # of the same file share an entry, and on mtime so edits invalidate it
+    file_path = Path(file_path).resolve()
+    mtime = file_path.stat().st_mtime
+    return _load_and_normalize_cached(str(file_path), mtime)
+
+@functools.lru_cache(maxsize=4)
+def _load_and_normalize_cached(file_path, mtime):
+    """
+    Load and normalize a FHIR file; memoized by load_and_normalize_data.
+    
+    Args:
+        file_path (str): Path to the FHIR JSON file
+        mtime (float): Modification time of the file, used only as a cache key
+    
+    Returns:
+        tuple: (patients_df, observations_df, medications_df, allergies_df)
+    """
+    # Prefer the columnar cache when it is up to date
+    cache_paths = get_cache_paths(file_path)
+    if is_cache_fresh(file_path, cache_paths):
+        return tuple(pd.read_parquet(cache_paths[table]) for table in CACHE_TABLES)
+    
+    # Stream large bundles so only one resource array is in memory at a time
+    if Path(file_path).stat().st_size > STREAMING_THRESHOLD_BYTES:
+        try:
+            return (
+                normalize_patients(load_fhir_resources(file_path, 'patients')),
+                normalize_observations(load_fhir_resources(file_path, 'observations')),
+                normalize_medications(load_fhir_resources(file_path, 'medications')),
+                normalize_allergies(load_fhir_resources(file_path, 'allergies'))
+            )
+        except ImportError:
+            # ijson is optional; without it, parse the whole bundle at once
+            pass
     
     # Load the data
     data = load_fhir_data(file_path)
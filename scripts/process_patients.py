@@ -2,6 +2,7 @@
 """
 Process patient data to extract relevant information and demographic statistics.
 """
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
@@ -43,13 +44,25 @@ def enrich_patient_data(patients_df):
     # Make a copy to avoid modifying original
     df = patients_df.copy()
     
-    # Calculate age from birthdate
-    df['age'] = df['birthdate'].apply(calculate_age)
+    # Calculate age from birthdate in one vectorized pass; invalid dates give <NA>
+    birth = pd.to_datetime(df['birthdate'], errors='coerce', format='%Y-%m-%d')
+    today = pd.Timestamp.now()
+    before_birthday = (birth.dt.month > today.month) | ((birth.dt.month == today.month) & (birth.dt.day > today.day))
+    df['age'] = (today.year - birth.dt.year - before_birthday.astype('int8')).astype('Int16')
     
-    # Create age groups
+    # Create age groups: searchsorted gives the bin index of each age, as
+    # pd.cut(right=False) would, without building intervals
     bins = [0, 18, 35, 50, 65, 120]
     labels = ['0-18', '19-35', '36-50', '51-65', '65+']
-    df['age_group'] = pd.cut(df['age'], bins=bins, labels=labels, right=False)
+    ages = df['age'].to_numpy(dtype='float64', na_value=np.nan)
+    codes = np.searchsorted(bins, ages, side='right') - 1
+    # Ages outside [0, 120) and missing ages get code -1, i.e. NaN
+    codes[~((ages >= bins[0]) & (ages < bins[-1]))] = -1
+    df['age_group'] = pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+    
+    # Store low-cardinality columns as categories so value_counts is a code count
+    for column in ('gender', 'state'):
+        df[column] = df[column].astype('category')
     
     return df
 
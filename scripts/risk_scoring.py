@@ -2,6 +2,7 @@
 """
 Implement risk scoring rules for diabetes and cardiovascular disease.
 """
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -13,6 +14,12 @@ import scripts.process_patients as process_patients
 DIABETES_HBA1C_THRESHOLD = 6.5
 CARDIOVASCULAR_CHOLESTEROL_THRESHOLD = 240
 
+# Observation codes (lowercased) of the lab values used for scoring
+LAB_CODES = {'hemoglobin a1c': 'hba1c', 'cholesterol': 'cholesterol'}
+
+# Risk categories, indexed by risk score
+RISK_CATEGORIES = ['Low Risk', 'Moderate Risk', 'High Risk']
+
 def get_latest_lab_values(observations_df):
     """
     Extract the latest lab values (HbA1c and Cholesterol) for each patient.
@@ -23,108 +30,68 @@ def get_latest_lab_values(observations_df):
     Returns:
         pandas.DataFrame: DataFrame with latest lab values per patient
     """
-    # Filter for HbA1c and Cholesterol observations
-    hba1c_obs = observations_df[observations_df['code'].str.lower() == 'hemoglobin a1c']
-    cholesterol_obs = observations_df[observations_df['code'].str.lower() == 'cholesterol']
-    
-    # Get the latest HbA1c for each patient
-    latest_hba1c = (hba1c_obs
-                   .sort_values(['patient_id', 'date'], ascending=[True, False])
-                   .groupby('patient_id')
-                   .first()
-                   .reset_index()
-                   .rename(columns={'value': 'hba1c_value', 'date': 'hba1c_date'})
-                   [['patient_id', 'hba1c_value', 'hba1c_date']])
-    
-    # Get the latest Cholesterol for each patient
-    latest_cholesterol = (cholesterol_obs
-                         .sort_values(['patient_id', 'date'], ascending=[True, False])
-                         .groupby('patient_id')
-                         .first()
-                         .reset_index()
-                         .rename(columns={'value': 'cholesterol_value', 'date': 'cholesterol_date'})
-                         [['patient_id', 'cholesterol_value', 'cholesterol_date']])
-    
-    # Merge the two datasets
-    latest_labs = pd.merge(latest_hba1c, latest_cholesterol, on='patient_id', how='outer')
-    
-    return latest_labs
+    # Lowercase the codes once and keep only HbA1c and Cholesterol readings
+    # that have a value, so a valueless newer reading never hides an older one
+    codes = observations_df['code'].str.lower()
+    is_lab = codes.isin(LAB_CODES) & observations_df['value'].notna()
+    labs = observations_df.loc[is_lab, ['patient_id', 'value', 'date']]
+    labs['lab'] = codes[is_lab].map(LAB_CODES)
+    
+    # Pick the latest reading per patient and lab with a hash groupby (no sort).
+    # Missing dates rank below every real date, so an undated reading is used
+    # only when it is the patient's only one; ties keep the first in file order
+    date_order = labs['date'].fillna('')
+    latest = labs.loc[date_order.groupby([labs['patient_id'], labs['lab']]).idxmax()]
+    
+    # Reshape to one row per patient: hba1c_value, hba1c_date, cholesterol_value, ...
+    latest_labs = latest.set_index(['patient_id', 'lab']).unstack('lab')
+    latest_labs.columns = [f'{lab}_{field}' for field, lab in latest_labs.columns]
+    latest_labs = latest_labs.reindex(columns=[
+        'hba1c_value', 'hba1c_date', 'cholesterol_value', 'cholesterol_date'
+    ])
+    # A lab nobody has comes back as an all-NaN float column; keep dates as strings
+    date_dtype = observations_df['date'].dtype
+    latest_labs = latest_labs.astype({'hba1c_date': date_dtype, 'cholesterol_date': date_dtype})
+    
+    return latest_labs.rename_axis('patient_id').reset_index()
 
-def apply_diabetes_risk_rule(latest_labs_df):
+def apply_risk_rules(latest_labs_df):
     """
-    Apply Diabetes risk rule: HbA1c ≥ 6.5
+    Apply the risk rules and calculate a combined risk score and category.
     
-    Args:
-        latest_labs_df (pandas.DataFrame): DataFrame with latest lab values
-        
-    Returns:
-        pandas.DataFrame: DataFrame with diabetes risk flag added
-    """
-    df = latest_labs_df.copy()
-    
-    # Apply diabetes risk rule
-    df['diabetes_risk'] = df['hba1c_value'] >= DIABETES_HBA1C_THRESHOLD
-    
-    return df
-
-def apply_cardiovascular_risk_rule(latest_labs_df):
-    """
-    Apply Cardiovascular risk rule: Cholesterol ≥ 240
+    Diabetes risk: HbA1c ≥ 6.5. Cardiovascular risk: Cholesterol ≥ 240.
     
     Args:
         latest_labs_df (pandas.DataFrame): DataFrame with latest lab values
         
     Returns:
-        pandas.DataFrame: DataFrame with cardiovascular risk flag added
+        pandas.DataFrame: DataFrame with risk flags, combined risk score,
+            category and reasons added
     """
-    df = latest_labs_df.copy()
-    
-    # Apply cardiovascular risk rule
-    df['cardiovascular_risk'] = df['cholesterol_value'] >= CARDIOVASCULAR_CHOLESTEROL_THRESHOLD
-    
-    return df
-
-def calculate_combined_risk(risk_df):
-    """
-    Calculate a combined risk score and category.
-    
-    Args:
-        risk_df (pandas.DataFrame): DataFrame with risk flags
-        
-    Returns:
-        pandas.DataFrame: DataFrame with combined risk score and category
-    """
-    df = risk_df.copy()
-    
-    # Initialize risk score (0-2 based on number of risks)
-    df['risk_score'] = 0
-    
-    # Add 1 for diabetes risk
-    df.loc[df['diabetes_risk'] == True, 'risk_score'] += 1
-    
-    # Add 1 for cardiovascular risk
-    df.loc[df['cardiovascular_risk'] == True, 'risk_score'] += 1
-    
-    # Create risk category
-    risk_categories = {
-        0: 'Low Risk',
-        1: 'Moderate Risk',
-        2: 'High Risk'
-    }
-    
-    df['risk_category'] = df['risk_score'].map(risk_categories)
-    
-    # Add reasons for flagging
-    df['risk_reasons'] = ''
-    
-    # Add diabetes reason
-    df.loc[df['diabetes_risk'] == True, 'risk_reasons'] += 'Diabetes Risk (HbA1c >= 6.5); '
-    
-    # Add cardiovascular reason
-    df.loc[df['cardiovascular_risk'] == True, 'risk_reasons'] += 'Cardiovascular Risk (Cholesterol >= 240); '
-    
-    # Trim trailing separator
-    df['risk_reasons'] = df['risk_reasons'].str.rstrip('; ')
+    # Compare the raw float arrays; missing lab values (NaN) compare False
+    hba1c = latest_labs_df['hba1c_value'].to_numpy(dtype='float64', na_value=np.nan)
+    cholesterol = latest_labs_df['cholesterol_value'].to_numpy(dtype='float64', na_value=np.nan)
+    diabetes = np.greater_equal(hba1c, DIABETES_HBA1C_THRESHOLD)
+    cardiovascular = np.greater_equal(cholesterol, CARDIOVASCULAR_CHOLESTEROL_THRESHOLD)
+    
+    # Add both risk flags and the risk score (0-2 based on number of risks)
+    # in one assign, which returns a new frame without copying the input first
+    df = latest_labs_df.assign(
+        diabetes_risk=diabetes,
+        cardiovascular_risk=cardiovascular,
+        risk_score=diabetes.astype('int8') + cardiovascular.astype('int8')
+    )
+    
+    # Create risk category; the risk score is already the category code
+    df['risk_category'] = pd.Categorical.from_codes(
+        df['risk_score'].to_numpy(dtype='int8'), categories=RISK_CATEGORIES, ordered=True
+    )
+    
+    # Compose reasons for flagging in one vectorized pass
+    diabetes_reason = np.where(diabetes, 'Diabetes Risk (HbA1c >= 6.5)', '')
+    cardiovascular_reason = np.where(cardiovascular, 'Cardiovascular Risk (Cholesterol >= 240)', '')
+    separator = np.where(diabetes & cardiovascular, '; ', '')
+    df['risk_reasons'] = np.char.add(np.char.add(diabetes_reason, separator), cardiovascular_reason)
     
     return df
 
@@ -148,24 +115,22 @@ def score_patient_risks(file_path=None):
     # Get latest lab values
     latest_labs_df = get_latest_lab_values(observations_df)
     
-    # Apply risk rules
-    risk_df = apply_diabetes_risk_rule(latest_labs_df)
-    risk_df = apply_cardiovascular_risk_rule(risk_df)
-    
-    # Calculate combined risk
-    risk_df = calculate_combined_risk(risk_df)
+    # Apply risk rules and calculate combined risk
+    risk_df = apply_risk_rules(latest_labs_df)
     
-    # Merge with patient data
-    patients_with_risks_df = pd.merge(enriched_patients_df, risk_df, on='patient_id', how='left')
+    # Join with patient data on the risk frame's patient_id index
+    patients_with_risks_df = enriched_patients_df.join(risk_df.set_index('patient_id'), on='patient_id', how='left')
     
-    # Generate risk summary
+    # Generate risk summary; both flag columns are summed in one pass
+    total_patients = len(patients_with_risks_df)
+    risk_counts = patients_with_risks_df[['diabetes_risk', 'cardiovascular_risk']].sum()
     risk_summary = {
-        'total_patients': len(patients_with_risks_df),
-        'diabetes_risk_count': patients_with_risks_df['diabetes_risk'].sum(),
-        'cardiovascular_risk_count': patients_with_risks_df['cardiovascular_risk'].sum(),
+        'total_patients': total_patients,
+        'diabetes_risk_count': int(risk_counts['diabetes_risk']),
+        'cardiovascular_risk_count': int(risk_counts['cardiovascular_risk']),
         'risk_category_counts': patients_with_risks_df['risk_category'].value_counts().to_dict(),
-        'diabetes_risk_percentage': (patients_with_risks_df['diabetes_risk'].sum() / len(patients_with_risks_df)) * 100,
-        'cardiovascular_risk_percentage': (patients_with_risks_df['cardiovascular_risk'].sum() / len(patients_with_risks_df)) * 100
+        'diabetes_risk_percentage': (risk_counts['diabetes_risk'] / total_patients) * 100,
+        'cardiovascular_risk_percentage': (risk_counts['cardiovascular_risk'] / total_patients) * 100
     }
     
     return patients_with_risks_df, risk_summary